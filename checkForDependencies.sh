@@ -178,6 +178,14 @@ if [ $? -ne 0 ]; then
     echo ""
 fi
 
+python -c 'import PIL'
+if [ $? -ne 0 ]; then
+    echo ""
+    echo "WARNING: Unable to find the Python package PIL (Pillow). You will need this package to draw gene neighborhood diagrams."
+    echo "It can be found at https://python-pillow.org/ or installed (using pip) via pip install Pillow"
+    echo ""
+fi
+
 python -c 'import matplotlib'
 if [ $? -ne 0 ]; then
     echo ""
@@ -6,15 +6,20 @@ graphics objects.
 '''
 
 from __future__ import print_function
-import colorsys
-import itertools
+import copy
+import io
 import math
+import numbers
 import numpy
 import os
 import tempfile
+import warnings
 
 from Bio.Graphics import GenomeDiagram
 from Bio.SeqFeature import SeqFeature, FeatureLocation
+from PIL import Image
+from reportlab.graphics import renderSVG
+from reportlab.graphics.shapes import Group
 from reportlab.lib import colors as rcolors
 
 from sanitizeString import *
@@ -22,25 +27,104 @@ from ClusterFuncs import *
 from FileLocator import *
 from TreeFuncs import splitTblastn
 
+# Color (in 0-255 RGB) used for genes in clusters that are too small to bother coloring
+GREY = (127,127,127)
+
 ###########################################
 # Functions for making SeqFeature objects #
 ###########################################
 
-def makeSeqFeature(geneid, cur):
+def _seqFeatureFromInfo(geneinfo, cluster_id=-1):
     '''
-    Make a BioPython SeqFeature object for a gene with ITEP ID geneid
+    Make a BioPython SeqFeature object from a "geneinfo" row (as returned by getGeneInfo)
+    without going back to the database.
     '''
+    return _seqFeatureFromLocation(geneinfo[0], int(geneinfo[5]), int(geneinfo[6]), int(geneinfo[8]), cluster_id = cluster_id)
 
-    geneinfo = getGeneInfo( [ geneid ], cur )
-    geneinfo = geneinfo[0]
-    start = int(geneinfo[5])
-    stop = int(geneinfo[6])
-    strand = int(geneinfo[8])
+def _seqFeatureFromLocation(geneid, start, stop, strand, cluster_id=-1):
+    '''
+    Make a BioPython SeqFeature object for a gene from its location.
+    '''
     feature = SeqFeature(FeatureLocation(start, stop), strand=strand, id=geneid)
     # This can be overwritten by other functions but we need a placeholder.
-    feature.qualifiers["cluster_id"] = -1
+    feature.qualifiers["cluster_id"] = cluster_id
     return feature
 
+# Cache of SeqFeature objects built from the database, keyed by gene ID, so that overlapping
+# neighborhoods don't look up the same genes over and over.
+# The cached objects are shared, so only ever hand out copies of them (see _copySeqFeature).
+# Only the genes from one database connection are cached at a time (the cache starts over when
+# a different connection is used). SQLite connections can't be weakly referenced, so the cache
+# holds on to that connection until clearSeqFeatureCache() is called or another connection is used.
+_seqFeatureCache = {}
+_seqFeatureCacheConnection = None
+_SEQFEATURE_CACHE_SIZE = 131072
+
+def clearSeqFeatureCache():
+    '''
+    Forget all cached SeqFeature objects. Call this if the gene locations in the database change,
+    and after closing the database connection so that the cache doesn't keep it alive.
+    '''
+    global _seqFeatureCacheConnection
+    _seqFeatureCache.clear()
+    _seqFeatureCacheConnection = None
+
+def _copySeqFeature(feature):
+    '''
+    Copy a cached SeqFeature so that callers can change its qualifiers (e.g. cluster_id)
+    without changing the cached one.
+    '''
+    newfeature = copy.copy(feature)
+    newfeature.qualifiers = dict(feature.qualifiers)
+    return newfeature
+
+def _getCachedSeqFeatures(geneids, cur):
+    '''
+    Returns a dictionary from gene ID to a (shared, cached) SeqFeature object for every
+    gene in geneids that is in the database. Only genes that aren't cached yet are looked up.
+    '''
+    global _seqFeatureCacheConnection
+    con = cur.connection
+    # Start over for a new connection, and when the cache fills up (crude size limit).
+    if con is not _seqFeatureCacheConnection or len(_seqFeatureCache) >= _SEQFEATURE_CACHE_SIZE:
+        _seqFeatureCache.clear()
+        _seqFeatureCacheConnection = con
+    missing = [ geneid for geneid in set(geneids) if geneid not in _seqFeatureCache ]
+    if len(missing) > 0:
+        ids, starts, ends, strands = getGeneInfoSoA(missing, cur)
+        for geneid, start, stop, strand in zip(ids, starts, ends, strands):
+            _seqFeatureCache[geneid] = _seqFeatureFromLocation(geneid, start, stop, strand)
+    features = {}
+    for geneid in geneids:
+        if geneid in _seqFeatureCache:
+            features[geneid] = _seqFeatureCache[geneid]
+    return features
+
+def makeSeqFeatures(geneids, cur):
+    '''
+    Make BioPython SeqFeature objects for a list of genes with ITEP IDs geneids.
+
+    The genes are looked up together (and cached, so later calls for the same genes
+    don't query the database). Returns a list of SeqFeature objects in the same order
+    as geneids; genes that are not in the database are skipped.
+    '''
+    geneToFeature = _getCachedSeqFeatures(geneids, cur)
+    return [ _copySeqFeature(geneToFeature[geneid]) for geneid in geneids if geneid in geneToFeature ]
+
+def makeSeqFeature(geneid, cur, geneinfo=None):
+    '''
+    Make a BioPython SeqFeature object for a gene with ITEP ID geneid
+
+    DEPRECATED - use makeSeqFeatures() to make features for several genes at once.
+
+    If the geneinfo row for the gene has already been fetched it can be passed
+    in to avoid querying the database again.
+    '''
+    warnings.warn("makeSeqFeature is deprecated; use makeSeqFeatures instead", DeprecationWarning, stacklevel=2)
+    if geneinfo is not None:
+        return _seqFeatureFromInfo(geneinfo)
+    return makeSeqFeatures([ geneid ], cur)[0]
+
 def makeSeqFeaturesForGeneNeighbors(genename, runid, cur):
     '''                                                                                                              
     Create seqFeature objects for a gene and its neighbors.
@@ -54,9 +138,12 @@ def makeSeqFeaturesForGeneNeighbors(genename, runid, cur):
     If the gene is not found it returns an empty list.
     '''
     outdata = getGeneNeighborhoods(genename, runid, cur)
+    # Make features for all of the neighbors in one go rather than one query per neighbor.
+    features = makeSeqFeatures([ neargene[1] for neargene in outdata ], cur)
+    geneToFeature = dict( (feature.id, feature) for feature in features )
     seqfeatures = []
     for neargene in outdata:
-        feature = makeSeqFeature(neargene[1], cur)
+        feature = geneToFeature[neargene[1]]
         feature.qualifiers["cluster_id"] = int(neargene[8])
         seqfeatures.append(feature)
     return seqfeatures
@@ -68,13 +155,13 @@ def makeSeqObjectsForTblastnNeighbors(tblastn_id, clusterrunid, cur, N=200000):
     returns a list of seq objects INCLUDING the TBLASTN hit itself so that we can show that
     on the region drawing.
 
-    We pick an N large enough to get at least one gene and then pick the closest one and get
+    We pick the closest gene (within N nucleotides) and get
     all of its neighbors with a call to makeSeqFeaturesForGeneNeighbors() and just tack the TBLASTN
     onto it. 
     '''
     # Lets first get the contig and start/stop locations (which tell us teh strand) out of    
     # the TBLASTN id. This returns a ValueError if it fails which the calling function can catch if needed. 
-    sanitizedToNot = getSanitizedContigList(cur)
+    sanitizedToNot = getSanitizedContigListCached(cur)
 
     # The tBLASTn ID holds information on where the hit was located.
     contig,start,stop = splitTblastn(tblastn_id)
@@ -91,26 +178,11 @@ def makeSeqObjectsForTblastnNeighbors(tblastn_id, clusterrunid, cur, N=200000):
     tblastn_feature = SeqFeature(FeatureLocation(start, stop), strand=strand, id=tblastn_id)
     tblastn_feature.qualifiers["cluster_id"] = -1
 
-    # Find the neighboring genes.
-    neighboring_genes = getGenesInRegion(contig, start-N, stop+N, cur)
-    if len(neighboring_genes) == 0:
+    # Find the closest gene to ours and get the clusters for its neighbors based on the specific clusterrunid
+    mingene = getClosestGeneOnContig(contig, start, stop, cur, maxdistance = N)
+    if mingene is None:
         sys.stderr.write("WARNING: No neighboring genes found for TBLASTN hit %s within %d nucleotides in contig %s\n" %(tblastn_id, N, contig))
         return [ tblastn_feature ]
-    else:
-        neighboring_geneinfo = getGeneInfo(neighboring_genes, cur)
-
-    # Find the closest gene to ours and get the clusters for those neighbors based on the specific clusterrunid                                                                                               
-    minlen = N
-    mingene = None
-    minstrand = None
-    for geneinfo in neighboring_geneinfo:
-        genestart = int(geneinfo[5])
-        geneend = int(geneinfo[6])
-        distance = min( abs(genestart - start), abs(geneend - start), abs(genestart - stop), abs(geneend - stop))
-        if distance < minlen:
-            mingene = geneinfo[0]
-            minlen = distance
-
     neighboring_features = makeSeqFeaturesForGeneNeighbors(mingene, clusterrunid, cur)
 
     # Add the TBLASTN itself and return it.
@@ -123,16 +195,184 @@ def makeSeqObjectsForTblastnNeighbors(tblastn_id, clusterrunid, cur, N=200000):
 
 def regionlength(seqfeatures):
     ''' Find the beginning and end of nucleotides spanning a set of gene locations '''
-    location = [(int(loc.location.start), int(loc.location.end)) for loc in seqfeatures]
-    starts, ends = list(zip(*location))
-    #have to compare both, as some are reversed
-    start = max(max(starts),max(ends))
-    end = min(min(starts),min(ends))
+    #have to compare both, as some are reversed, so put starts and ends in one array
+    #(sized up front so numpy fills a single buffer instead of growing it)
+    locations = numpy.fromiter( (loc for feature in seqfeatures for loc in (int(feature.location.start), int(feature.location.end))),
+                                dtype=numpy.int64, count = 2*len(seqfeatures) )
+    start = int(locations.max())
+    end = int(locations.min())
     return start, end
 
-def make_region_drawing(seqfeatures, getcolor, centergenename, maxwidth, tempdir=None, imgfileloc = None, label=False, labeltype = 'clusterid' ):
+class RegionDrawer(object):
     '''
-    Makes a PNG figure for regions with a given color mapping, set of gene locations... 
+    Draws region figures (see make_region_drawing for the meaning of the arguments).
+
+    One GenomeDiagram diagram and track are set up when the RegionDrawer is created and are reused
+    (with a fresh feature set) for every region drawn, and the aliases file is only read once,
+    so drawing many regions (e.g. one for each leaf of a tree) doesn't redo that setup every time.
+    '''
+    def __init__(self, label=False, labeltype = 'clusterid'):
+        self.label = label
+        self.labeltype = labeltype
+
+        # Set up an entry genome diagram object                                                                                                                                                                   
+        self.gd_diagram = GenomeDiagram.Diagram("Genome Region")
+        self.gd_track_for_features = self.gd_diagram.new_track(1, name="Annotated Features")
+
+        # Some basic properties of the figure itself
+        self.arrowshaft_height = 0.3
+        self.arrowhead_length = 0.3
+        self.scale = 20     #AA per px for the diagram
+
+        if label:
+            # y-margins need to be bigger if we have labels
+            # Since labels could be on the top or the bottom we need to account for either possibility
+            # Labels are longer for other types than for cluster IDs (which are typically < 6 characters)
+            if labeltype == 'clusterid':
+                self.yt = 0.1
+                self.yb = 0.1
+                self.ht = 350
+                self.default_fontsize = 25
+            else:
+                self.yt = 0.3
+                self.yb = 0.3
+                self.ht = 725
+                self.default_fontsize = 16 # Font size for genome diagram labels
+        else:
+            self.yt = 0
+            self.yb = 0
+            self.ht = 250
+            self.default_fontsize = 16 # Doesnt matter
+
+        self.geneIdToAlias = {}
+        if label:
+            if labeltype == "aliases":
+                if os.path.exists(locateAliasesFile()):
+                    for line in open(locateAliasesFile(), "r"):
+                        spl = line.strip("\r\n").split("\t")
+                        if spl[0] in self.geneIdToAlias:
+                            self.geneIdToAlias[spl[0]].append(spl[1])
+                        else:
+                            self.geneIdToAlias[spl[0]] = [ spl[1] ]
+
+    def draw(self, seqfeatures, getcolor, centergenename, maxwidth, tempdir=None, imgfileloc = None, imgformat = 'png', return_bytes = False):
+        '''
+        Draw one region. Returns the location of the image file (or its contents if return_bytes is TRUE).
+        '''
+        gd_feature_set = self.gd_track_for_features.new_set()
+        try:
+            img = self._render(gd_feature_set, seqfeatures, getcolor, centergenename, maxwidth, imgformat)
+        finally:
+            # Clear the features out so the track is ready for the next region.
+            self.gd_track_for_features.del_set(gd_feature_set.id)
+
+        if return_bytes:
+            return img
+
+        # The files are not automatically deleted
+        # but at least this prevents collisions.
+        # A user who wants to clean up should specify a temporary directory and delete it afterward.
+        if imgfileloc is None:
+            if tempdir is None:
+                tempdir = tempfile.gettempdir()
+            imghandle = tempfile.NamedTemporaryFile(delete=False, dir=tempdir, suffix="." + imgformat)
+            imghandle.write(img)
+            imghandle.close()
+            imgfileloc = imghandle.name
+        else:
+            fid = open(imgfileloc, "wb")
+            fid.write(img)
+            fid.close()
+        return imgfileloc
+
+    def _render(self, gd_feature_set, seqfeatures, getcolor, centergenename, maxwidth, imgformat):
+        if imgformat not in [ 'png', 'svg' ]:
+            raise ValueError("Invalid imgformat %s - must be 'png' or 'svg'" %(imgformat))
+
+        label = self.label
+        labeltype = self.labeltype
+        geneIdToAlias = self.geneIdToAlias
+        scale = self.scale
+
+        # Find the center gene (we need its location to line up the figure and its strand to know whether to flip it)
+        center = None
+        for feature in seqfeatures:
+            if feature.id == centergenename:
+                center = feature
+                break
+        if center is None:
+            raise ValueError("ERROR: The center gene %s is not one of the provided seqfeatures" %(centergenename))
+        centerdstart, centerend = int(center.location.start), int(center.location.end)
+        centerdstrand = center.strand
+
+        # Build arrow objects for all of our features.
+        # Look these up once rather than on every pass through the loop.
+        getcolor_get = getcolor.get
+        add_feature = gd_feature_set.add_feature
+        white = rcolors.white
+        red = rcolors.red
+        for feature in seqfeatures:
+            bordercol = white
+            cluster_id = feature.qualifiers["cluster_id"]
+
+            if feature is center:
+                bordercol = red
+            # Anything not in the color map is greyed out
+            color = getcolor_get(cluster_id, GREY)
+
+            name = feature.id
+            if label:
+                if labeltype == "aliases":
+                    if feature.id in geneIdToAlias:
+                        name = "_".join(geneIdToAlias[feature.id])                   
+                        if len(name) > 30:
+                            name = name[0:30]
+                elif labeltype == "clusterid":
+                    name = str(cluster_id)
+                else:
+                    raise IOError("Invalid labeltype")
+
+            # 90 degrees to avoid the rightmost feature going off the screen
+            add_feature(feature, name = name,
+                        color=color, border = bordercol,
+                        sigil="ARROW", arrowshaft_height=self.arrowshaft_height, arrowhead_length = self.arrowhead_length,
+                        label=label,  label_angle=90, label_size = self.default_fontsize, label_position = 'middle'
+                        )
+
+        start, end = regionlength(seqfeatures)
+        pagew_px = maxwidth / scale
+        #offset so start of gene of interest lines up in all the figures
+        midcentergene = abs(centerend - centerdstart)/2 + min(centerdstart, centerend)
+        l2mid = abs(midcentergene - start)
+        r2mid = abs(midcentergene - end)
+        roffset = float((pagew_px/2) - (l2mid/scale))
+        loffset = float((pagew_px/2) - (r2mid/scale))
+
+        gd_diagram = self.gd_diagram
+        gd_diagram.draw(format="linear", start=start, end=end, fragments=1, pagesize=(self.ht, pagew_px), xl=(loffset/pagew_px), xr=(roffset/pagew_px), yt=self.yt, yb=self.yb )
+
+        if imgformat == 'svg':
+            #flip for reversed genes - with vector output we just put the whole drawing in a group rotated around its center
+            if centerdstrand == -1:
+                drawing = gd_diagram.drawing
+                rotated = Group(*drawing.contents)
+                rotated.transform = (-1, 0, 0, -1, drawing.width, drawing.height)
+                drawing.contents = [ rotated ]
+            img = renderSVG.drawToString(gd_diagram.drawing)
+            if not isinstance(img, bytes):
+                img = img.encode("utf-8")
+        else:
+            img = gd_diagram.write_to_string("PNG")
+            #flip for reversed genes (in memory, so we only write the file once)
+            if centerdstrand == -1:
+                rotated = io.BytesIO()
+                Image.open(io.BytesIO(img)).transpose(Image.ROTATE_180).save(rotated, "PNG")
+                img = rotated.getvalue()
+        return img
+
+def make_region_drawing(seqfeatures, getcolor, centergenename, maxwidth, tempdir=None, imgfileloc = None, label=False, labeltype = 'clusterid', imgformat = 'png', return_bytes = False ):
+    '''
+    Makes a PNG or SVG figure for regions with a given color mapping, set of gene locations... 
 
     seqfeatures is a list of SeqFeature objects (with the cluster_id qualifier)
     getcolor is a map from cluster ID to the desired color
@@ -144,106 +384,32 @@ def make_region_drawing(seqfeatures, getcolor, centergenename, maxwidth, tempdir
     labeltype: 'clusterid' : Add numeric cluster ID to each feature
                'aliases'   : Add a underscore-delimited list of aliases to each feature (aliases file is located in $ITEP_ROOT/aliases/aliases)
 
+    imgformat: 'png' : Rasterize the figure to a PNG
+               'svg' : Write the figure as SVG (faster since it skips rasterization - use it if whatever displays the figure can render SVG)
+
     If an output file is unspecified the region drawing will be made temporary in tempdir (or if that isn't specified either, it will be made temporary
     in a new directory created in /tmp/ or the default temporary directory for Python)
-    '''
-
-    # The files are not automatically deleted
-    # but at least this prevents collisions.
-    # A user who wants to clean up should specify a temporary directory and delete it afterward.
-    if imgfileloc is None:
-        if tempdir is None:
-            tempdir = tempfile.gettempdir()
-        imghandle = tempfile.NamedTemporaryFile(delete=False, dir=tempdir)
-        imgfileloc = imghandle.name
-
-    # Set up an entry genome diagram object                                                                                                                                                                   
-    gd_diagram = GenomeDiagram.Diagram("Genome Region")
-    gd_track_for_features = gd_diagram.new_track(1, name="Annotated Features")
-    gd_feature_set = gd_track_for_features.new_set()
-
-    # Some basic properties of the figure itself
-    arrowshaft_height = 0.3
-    arrowhead_length = 0.3
-    scale = 20     #AA per px for the diagram
-
-    if label:
-        # y-margins need to be bigger if we have labels
-        # Since labels could be on the top or the bottom we need to account for either possibility
-        # Labels are longer for other types than for cluster IDs (which are typically < 6 characters)
-        if labeltype == 'clusterid':
-            yt = 0.1
-            yb = 0.1
-            ht = 350
-            default_fontsize = 25
-        else:
-            yt = 0.3
-            yb = 0.3
-            ht = 725
-            default_fontsize = 16 # Font size for genome diagram labels
-    else:
-        yt = 0
-        yb = 0
-        ht = 250
-        default_fontsize = 16 # Doesnt matter
-
-    geneIdToAlias = {}
-    if label:
-        if labeltype == "aliases":
-            if os.path.exists(locateAliasesFile()):
-                for line in open(locateAliasesFile(), "r"):
-                    spl = line.strip("\r\n").split("\t")
-                    if spl[0] in geneIdToAlias:
-                        geneIdToAlias[spl[0]].append(spl[1])
-                    else:
-                        geneIdToAlias[spl[0]] = [ spl[1] ]
-
-    # Build arrow objects for all of our features.
-    for feature in seqfeatures:
-        bordercol=rcolors.white
-
-        if feature.id == centergenename:
-            bordercol=rcolors.red
-            centerdstart, centerend = int(feature.location.start), int(feature.location.end)
-            centerdstrand = feature.strand
-        color = getcolor[feature.qualifiers["cluster_id"]]
-
-        name = feature.id
-        if label:
-            if labeltype == "aliases":
-                if feature.id in geneIdToAlias:
-                    name = "_".join(geneIdToAlias[feature.id])                   
-                    if len(name) > 30:
-                        name = name[0:30]
-            elif labeltype == "clusterid":
-                name = str(feature.qualifiers["cluster_id"])
-            else:
-                raise IOError("Invalid labeltype")
 
-        # 90 degrees to avoid the rightmost feature going off the screen
-        gd_feature_set.add_feature(feature, name = name,
-                                   color=color, border = bordercol,
-                                   sigil="ARROW", arrowshaft_height=arrowshaft_height, arrowhead_length = arrowhead_length,
-                                   label=label,  label_angle=90, label_size = default_fontsize, label_position = 'middle'
-                                   )
+    If return_bytes is TRUE, nothing is written to disk and the contents of the image are returned instead of a file name.
+    '''
 
-    start, end = regionlength(seqfeatures)
-    pagew_px = maxwidth / scale
-    #offset so start of gene of interest lines up in all the figures
-    midcentergene = abs(centerend - centerdstart)/2 + min(centerdstart, centerend)
-    l2mid = abs(midcentergene - start)
-    r2mid = abs(midcentergene - end)
-    roffset = float((pagew_px/2) - (l2mid/scale))
-    loffset = float((pagew_px/2) - (r2mid/scale))
+    drawer = RegionDrawer(label = label, labeltype = labeltype)
+    return drawer.draw(seqfeatures, getcolor, centergenename, maxwidth, tempdir = tempdir, imgfileloc = imgfileloc,
+                       imgformat = imgformat, return_bytes = return_bytes)
 
-    gd_diagram.draw(format="linear", start=start, end=end, fragments=1, pagesize=(ht, pagew_px), xl=(loffset/pagew_px), xr=(roffset/pagew_px), yt=yt, yb=yb )
+def make_region_drawings(regions, getcolor, maxwidth, tempdir=None, label=False, labeltype = 'clusterid', imgformat = 'png', return_bytes = False ):
+    '''
+    Make region drawings for several regions at once, sharing one RegionDrawer between them.
 
-    gd_diagram.write(imgfileloc, "PNG")
+    regions is a list of (seqfeatures, centergenename) pairs. The other arguments are the same as
+    for make_region_drawing (each image goes in its own temporary file).
 
-    #flip for reversed genes
-    if centerdstrand == -1:
-        os.system("convert -rotate 180 %s %s" % (imgfileloc, imgfileloc))
-    return imgfileloc
+    Returns a list of image file locations (or of image contents if return_bytes is TRUE) in the
+    same order as regions.
+    '''
+    drawer = RegionDrawer(label = label, labeltype = labeltype)
+    return [ drawer.draw(seqfeatures, getcolor, centergenename, maxwidth, tempdir = tempdir, imgformat = imgformat, return_bytes = return_bytes)
+             for seqfeatures, centergenename in regions ]
 
 
 def makeClusterColorMap(seqfeatures, greyout):
@@ -272,55 +438,167 @@ def makeClusterColorMap(seqfeatures, greyout):
     else:
         getcolor = {}
 
-    #also add in grey (0.5,0.5,0.5 in RGB) for all others                                                                                                                                                     
+    #also add in grey (127,127,127 in RGB) for all others                                                                                                                                                     
     singleclusters = [c for c in uniqueclusters if allclusters.count(c) < greyout]
-    getcolor.update([(sc, (0.5,0.5,0.5)) for sc in singleclusters])
+    getcolor.update([(sc, GREY) for sc in singleclusters])
     return getcolor
 
 ##############################
 # Putting it all together... #
 ##############################
-def makeSingleGeneNeighborhoodDiagram(geneid, runid, cur, tempdir=None, imgfileloc = None, labeltype = 'clusterid'):
+def makeSingleGeneNeighborhoodDiagram(geneid, runid, cur, tempdir=None, imgfileloc = None, labeltype = 'clusterid', imgformat = 'png', drawer = None):
     '''
     Make a genome context diagram for a single gene with ITEP ID geneid.
+
+    imgformat is 'png' or 'svg' (see make_region_drawing)
+
+    When making diagrams for many genes, pass in one RegionDrawer(label=True, labeltype=labeltype)
+    as drawer so that its setup is shared between them (labeltype is ignored if drawer is given).
     '''
     seqfeatures = makeSeqFeaturesForGeneNeighbors(geneid, runid, cur)
     getcolor = makeClusterColorMap(seqfeatures, 1)
     start, end = regionlength(seqfeatures)
     width = abs(end - start)
-    imgfileloc = make_region_drawing(seqfeatures, getcolor, geneid, width, tempdir=tempdir, imgfileloc = imgfileloc, label=True, labeltype = labeltype)
+    if drawer is None:
+        drawer = RegionDrawer(label = True, labeltype = labeltype)
+    imgfileloc = drawer.draw(seqfeatures, getcolor, geneid, width, tempdir = tempdir, imgfileloc = imgfileloc, imgformat = imgformat)
     return imgfileloc
 
 ##########################
 # Other utilities        #
 ##########################
 
+# Two-digit hex strings for every possible 8-bit channel value
+_HEX_CHANNEL = [ '%02x' % (x) for x in range(256) ]
+
 def RGB_to_hex(RGBlist):
     '''
     Convert an RGB color into a HEX string (required for some display functions)
+
+    RGBlist is a list of (red, green, blue) tuples of integers from 0 to 255 (as returned by colormap)
     '''
-    n = lambda x: int(x*255)
-    RGB256 = [(n(r),n(g),n(b)) for r,g,b in RGBlist]
-    colors = ['#%02x%02x%02x' % (r, g, b) for r, g, b in RGB256]
+    colors = []
+    for rgb in RGBlist:
+        for v in rgb:
+            if not isinstance(v, numbers.Integral) or v < 0 or v > 255:
+                raise ValueError("RGB_to_hex requires (red, green, blue) tuples of integers from 0 to 255 (0 to 1 floats are no longer accepted) but got %s" %(str(rgb)))
+        r, g, b = rgb
+        colors.append('#' + _HEX_CHANNEL[r] + _HEX_CHANNEL[g] + _HEX_CHANNEL[b])
     return colors
 
+def _hsvToRGBNumpy(hsv):
+    '''
+    Vectorized version of colorsys.hsv_to_rgb. hsv is an (N, 3) array of hue, saturation and value
+    for each color. Returns an (N, 3) array of red, green and blue.
+    '''
+    h = hsv[:, 0]
+    s = hsv[:, 1]
+    v = hsv[:, 2]
+    i = numpy.floor(h*6.0).astype(int)
+    f = (h*6.0) - i
+    p = v*(1.0 - s)
+    q = v*(1.0 - s*f)
+    t = v*(1.0 - s*(1.0 - f))
+    i = i % 6
+    r = numpy.choose(i, [v, q, p, p, t, v])
+    g = numpy.choose(i, [t, v, v, q, p, p])
+    b = numpy.choose(i, [p, p, t, v, v, q])
+    return numpy.column_stack((r, g, b))
+
+def _hsvGridToRGBNumpy(perm, N):
+    '''
+    Convert the first N colors of a perm x perm grid of hues and saturations (hue varies slowest,
+    value is fixed at 0.7) to RGB. Returns an (N, 3) array.
+    '''
+    #need offset, as humans can't tell colors that are unsaturated apart
+    H = numpy.arange(perm) * 1.0 / perm
+    S = numpy.arange(perm) * 1.0 / perm + 0.2
+    # Create all combinations of our colors (H varies slowest) and truncate at the correct length.
+    H, S = numpy.meshgrid(H, S, indexing='ij')
+    hsv = numpy.column_stack((H.ravel()[:N], S.ravel()[:N], numpy.full(N, 0.7)))
+    return _hsvToRGBNumpy(hsv)
+
+# Numba is optional and slow to start, so it is only used for color maps big enough to pay for that.
+# With a warm compile cache, importing numba and running the kernel takes ~0.3 s for 1 to 3 million colors,
+# while the numpy version takes ~0.4 s for 3 million and ~1.4 s for 10 million. The first run also compiles
+# the kernel (~0.6 s more), which numba only makes back at about 5 million colors.
+_NUMBA_MIN_COLORS = 5000000
+_numbaHsvGridToRGB = None
+_numbaChecked = False
+
+def _getNumbaHsvGridToRGB():
+    '''
+    Import numba and build the numba version of _hsvGridToRGBNumpy the first time this is called.
+    Returns None if numba is not installed.
+    '''
+    global _numbaHsvGridToRGB, _numbaChecked
+    if _numbaChecked:
+        return _numbaHsvGridToRGB
+    _numbaChecked = True
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, cache=True)
+    def _hsvGridToRGBNumba(perm, N):
+        '''
+        Numba version of _hsvGridToRGBNumpy (one parallel pass, no temporary arrays).
+        '''
+        out = numpy.empty((N, 3))
+        for k in prange(N):
+            h = (k // perm) * 1.0 / perm
+            s = (k % perm) * 1.0 / perm + 0.2
+            v = 0.7
+            # Same as colorsys.hsv_to_rgb
+            i = int(h*6.0)
+            f = (h*6.0) - i
+            p = v*(1.0 - s)
+            q = v*(1.0 - s*f)
+            t = v*(1.0 - s*(1.0 - f))
+            i = i % 6
+            if i == 0:
+                r, g, b = v, t, p
+            elif i == 1:
+                r, g, b = q, v, p
+            elif i == 2:
+                r, g, b = p, v, t
+            elif i == 3:
+                r, g, b = p, q, v
+            elif i == 4:
+                r, g, b = t, p, v
+            else:
+                r, g, b = v, p, q
+            out[k, 0] = r
+            out[k, 1] = g
+            out[k, 2] = b
+        return out
+
+    _numbaHsvGridToRGB = _hsvGridToRGBNumba
+    return _numbaHsvGridToRGB
+
+def _hsvGridToRGB(perm, N):
+    '''
+    Same as _hsvGridToRGBNumpy, but uses numba instead for very large numbers of colors if it is installed.
+    '''
+    if N >= _NUMBA_MIN_COLORS:
+        kernel = _getNumbaHsvGridToRGB()
+        if kernel is not None:
+            return kernel(perm, N)
+    return _hsvGridToRGBNumpy(perm, N)
+
 def colormap(valuelist):
     '''
     Generate a list of divergent colors for use with labeling SeqFeature objects
+
+    Colors are (red, green, blue) tuples of integers from 0 to 255.
     '''
     values = numpy.unique(valuelist)
-    N = len(values)
+    N = values.size
     #we will vary in 2 dimensions, so this is how many steps in each
     perm = int(math.ceil(math.sqrt(N)))
-    #need offset, as humans can't tell colors that are unsaturated apart
-    H = [(x*1.0/perm) for x in range(perm)]
-    S = [(x*1.0/perm)+0.2 for x in range(perm)]
-    #we will use this to truncate at correct length
-    V = [0.7]*N
-    # Create all combinations of our colors.                                                                                                                                                           
-    HS = itertools.product(H, S)
-    H, S = list(zip(*HS))
-    HSV = list(zip(H,S,V))
-    RGB = [colorsys.hsv_to_rgb(h,s,v) for h, s, v in HSV]
-    colorlookup = dict(list(zip(values, RGB[:N])))
+    # Quantize to 8 bits per channel (high saturations can push a channel slightly below 0)
+    RGB = numpy.clip(_hsvGridToRGB(perm, N) * 255 + 0.5, 0, 255).astype(numpy.uint8)
+    RGB = [ tuple(rgb) for rgb in RGB.tolist() ]
+    colorlookup = dict(list(zip(values.tolist(), RGB)))
     return colorlookup
@@ -39,6 +39,32 @@ def getSanitizedContigList(cur):
         sanitizedToNot[sanitizeString(res[0], False)] = res[0]
     return sanitizedToNot
 
+# Cache of getSanitizedContigList results, keyed by the SQLite connection they came from.
+# Only the most recently used connection is kept (SQLite connections can't be weakly referenced,
+# so this stops the cache from keeping every connection ever used alive).
+_sanitizedContigCache = {}
+
+def getSanitizedContigListCached(cur):
+    '''
+    Same as getSanitizedContigList but only queries the database the first time it is
+    called for a given database connection. Later calls return the same dictionary
+    (so don't modify it).
+
+    If the contigs table changes, call clearSanitizedContigCache() to force a new lookup.
+    Call it after closing the database connection too, so that the cache doesn't keep it alive.
+    '''
+    con = cur.connection
+    if con not in _sanitizedContigCache:
+        _sanitizedContigCache.clear()
+        _sanitizedContigCache[con] = getSanitizedContigList(cur)
+    return _sanitizedContigCache[con]
+
+def clearSanitizedContigCache():
+    '''
+    Forget all cached results from getSanitizedContigListCached() (and the connection they came from).
+    '''
+    _sanitizedContigCache.clear()
+
 def findRepresentativeAnnotation(runid, clusterid, cur):
     '''
     Identifies the most common annotation in a cluster/runID pair and returns a string
@@ -288,6 +314,45 @@ def getGenesInRegion(contig_id, start, stop, cur, overhang=0):
 
     return genelist
 
+def getClosestGeneOnContig(contig_id, start, stop, cur, maxdistance=None):
+    '''
+    Call the SQLITE database with cursor "cur" to find the gene on the specified contig
+    with a start or end closest to either start or stop (pass the same number for both to search
+    around a single position).
+
+    Rather than pulling every gene in a window out of the database, we only ask for the nearest
+    gene boundary on either side of start and stop (at most 8 rows) and pick the closest of those.
+
+    Returns the gene ID of the closest gene, or None if there are no genes on the contig
+    (or none closer than maxdistance nucleotides, if maxdistance is specified).
+    '''
+    subqueries = []
+    params = []
+    for col in [ "genestart", "geneend" ]:
+        for pos in [ start, stop ]:
+            subqueries.append("""SELECT * FROM ( SELECT geneid, genestart, geneend FROM processed
+                                 WHERE processed.contig_mod = ? AND processed.%s <= ?
+                                 ORDER BY processed.%s DESC LIMIT 1 )""" %(col, col) )
+            subqueries.append("""SELECT * FROM ( SELECT geneid, genestart, geneend FROM processed
+                                 WHERE processed.contig_mod = ? AND processed.%s >= ?
+                                 ORDER BY processed.%s ASC LIMIT 1 )""" %(col, col) )
+            params += [ contig_id, pos, contig_id, pos ]
+    cur.execute(" UNION ".join(subqueries) + ";", params)
+
+    mingene = None
+    mindistance = None
+    for res in cur:
+        genestart = int(res[1])
+        geneend = int(res[2])
+        distance = min( abs(genestart - start), abs(geneend - start), abs(genestart - stop), abs(geneend - stop) )
+        if mindistance is None or distance < mindistance:
+            mingene = res[0]
+            mindistance = distance
+
+    if maxdistance is not None and mindistance is not None and mindistance >= maxdistance:
+        return None
+    return mingene
+
 def getGenesInCluster(runid, clusterid, cur):
     '''
     Get the genes in a cluster with ID clusterid from run with ID runid.
@@ -300,20 +365,54 @@ def getGenesInCluster(runid, clusterid, cur):
     geneids = [ str(s[0]) for s in cur ]
     return geneids    
     
+def _getProcessedRows(genelist, columns, cur):
+    '''
+    Get the specified columns (a SQL column list whose first column is geneid) from the processed
+    table for a list of gene IDs. Returns the rows in the same order as the input (genes not in the
+    database are skipped).
+    '''
+    genelist = list(genelist)
+
+    # Look the genes up in groups of MAX_PARAMS with IN statements rather than
+    # one query per gene. The sqlite-defined limit is 999; 100 should be safe.
+    MAX_PARAMS = 100
+    geneToRow = {}
+    for ii in range(0, len(genelist), MAX_PARAMS):
+        ARR_PORTION = genelist[ii:ii+MAX_PARAMS]
+        IN_ARRAY = ",".join( ["?"]*len(ARR_PORTION) )
+        q = "SELECT %s from processed WHERE processed.geneid IN ( %s );" %(columns, IN_ARRAY)
+        cur.execute(q, ARR_PORTION)
+        for k in cur:
+            geneToRow[k[0]] = k
+
+    return [ geneToRow[gene] for gene in genelist if gene in geneToRow ]
+
 def getGeneInfo(genelist, cur):
     '''
     Given a list of gene IDs, returns the "geneinfo" as a list of tuples
     in the same format as expected from output of db_getGeneInformation.py and
     db_getClusterGeneInformation.py...
     '''
+    rows = _getProcessedRows(genelist, "processed.*", cur)
+    return [ [ str(s) for s in k ] for k in rows ]
 
-    q = "SELECT processed.* from processed WHERE processed.geneid = ?;"
-    res = []
-    for gene in genelist:
-        cur.execute(q, (gene,))
-        for k in cur:
-            res.append( [ str(s) for s in k ] )
-    return res
+def getGeneInfoSoA(genelist, cur):
+    '''
+    Given a list of gene IDs, returns the locations of those genes as four parallel
+    lists (one entry per gene) rather than as a list of geneinfo rows:
+
+    (gene IDs, start positions, end positions, strand signs (+1 or -1))
+
+    Only the location columns are read from the database (getGeneInfo also pulls
+    the sequences). Genes are in the same order as the input and genes not in the
+    database are skipped, like getGeneInfo.
+    '''
+    rows = _getProcessedRows(genelist, "geneid, genestart, geneend, strandsign", cur)
+    ids = [ str(k[0]) for k in rows ]
+    starts = [ int(k[1]) for k in rows ]
+    ends = [ int(k[2]) for k in rows ]
+    strands = [ int(k[3]) for k in rows ]
+    return ids, starts, ends, strands
 
 def getClusterGeneInfo(runid, clusterid, cur):
     '''
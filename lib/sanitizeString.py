@@ -9,11 +9,13 @@ import re, warnings
 '''This is an internal function to standardize sanitation of strings for unput into various formats.
 Any character that is not a letter or number is replaced with an underscore.'''
 
+# I would've kept periods in here but RangerDTL chokes on them...
+# sigh. That's all I can say.
+# Compiled once here since sanitizeString is called for every gene ID, leaf name, etc.
+_SANITIZE_RE = re.compile("[^0-9A-Za-z]")
+
 def sanitizeString(string, warnOfReplacement):
-    # I would've kept periods in here but RangerDTL chokes on them...
-    # sigh. That's all I can say.
-    rem = re.compile("[^0-9A-Za-z]")
-    s = rem.sub("_", string)
+    s = _SANITIZE_RE.sub("_", string)
     if warnOfReplacement and not string == s:
         warnings.warn("WARNING: String %s replaced with sanitized version  %s\n" %(string, s) )
     return s
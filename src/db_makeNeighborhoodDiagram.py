@@ -21,10 +21,15 @@ parser.add_option("-d", "--directory", help="Directory in which to save neighbor
                   dest="directory", type="str", default='geneNeighborhoods')
 parser.add_option("-l", "--labeltype", help="Type of label to use. Valid types are 'aliases' or 'clusterid' (D: aliases)", action="store", dest="labeltype", type="str", default="aliases")
 parser.add_option("-g", "--genecol", help="Column number for gene IDs starting from 1 (D: 1)", action="store", dest="gc", type="int", default=1)
+parser.add_option("-f", "--format", help="Image format for the diagrams. Valid formats are 'png' or 'svg' (D: png)", action="store", dest="imgformat", type="str", default="png")
 (options, args) = parser.parse_args()
 
 gc = options.gc - 1
 
+if options.imgformat not in [ 'png', 'svg' ]:
+    sys.stderr.write("ERROR: Invalid image format %s - must be 'png' or 'svg'\n" %(options.imgformat))
+    exit(2)
+
 if len(args) < 1:
     sys.stderr.write("ERROR: Run ID is required argument.\n")
     exit(2)
@@ -37,10 +42,13 @@ runid = args[0]
 if not os.path.exists(options.directory):
     os.makedirs(options.directory)
 
+# Set up the diagram (and read the aliases file) once rather than for every gene
+drawer = RegionDrawer(label = True, labeltype = options.labeltype)
+
 for line in fileinput.input("-"):
     spl = line.strip("\r\n").split("\t")
     geneid = spl[gc]
-    diagram = makeSingleGeneNeighborhoodDiagram(geneid, runid, cur, labeltype = options.labeltype, imgfileloc = os.path.join(options.directory, sanitizeString(geneid, False)))
+    diagram = makeSingleGeneNeighborhoodDiagram(geneid, runid, cur, imgformat = options.imgformat, drawer = drawer, imgfileloc = os.path.join(options.directory, sanitizeString(geneid, False) + "." + options.imgformat))
     sys.stderr.write("Saved result to %s\n" %(diagram))
 
 cur.close()
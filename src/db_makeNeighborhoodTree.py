@@ -54,14 +54,6 @@ from ete2 import Tree, faces, TreeStyle, TextFace, PhyloTree
 from ete2 import Phyloxml, phyloxml
 
 
-def regionlength(genelocs):
-    location = [(int(loc.location.start), int(loc.location.end)) for loc in genelocs]
-    starts, ends = list(zip(*location))
-    #have to compare both, as some are reversed
-    start = max(max(starts),max(ends))
-    end = min(min(starts),min(ends))
-    return start, end
-
 def draw_tree_regions(clusterrunid, t, ts, cur, greyout=3, tempdir=None, label=False):
     '''
     Draw the neighborhoods around each of the genes in a gene tree given the cluster and run IDs and the tree (t)
@@ -120,6 +112,8 @@ def draw_tree_regions(clusterrunid, t, ts, cur, greyout=3, tempdir=None, label=F
         widths.append(abs(end - start))
     maxwidth = max(widths)
 
+    drawleaves = []
+    regions = []
     for leaf in t.iter_leaves():
         newname = unsanitizeGeneId(leaf.name)
         # Not all genes necessarily are in the database and we don't want to crash if that happens.
@@ -128,8 +122,13 @@ def draw_tree_regions(clusterrunid, t, ts, cur, greyout=3, tempdir=None, label=F
             genelocs = seqfeatures[newname]
         except KeyError: 
             continue 
-        sys.stderr.write("Making region drawing for gene ID %s...\n" %(newname))
-        imgfileloc = make_region_drawing(genelocs, getcolor, newname, maxwidth, tempdir=tempdir, label=label)
+        drawleaves.append(leaf)
+        regions.append( (genelocs, newname) )
+
+    # Draw all of the regions with one set of drawing objects.
+    sys.stderr.write("Making region drawings for %d genes...\n" %(len(regions)))
+    imgfilelocs = make_region_drawings(regions, getcolor, maxwidth, tempdir=tempdir, label=label)
+    for leaf, imgfileloc in zip(drawleaves, imgfilelocs):
         imageFace = faces.ImgFace(imgfileloc)
         leaf.add_face(imageFace, column=2, position = 'aligned')
 
@@ -150,7 +149,7 @@ def treelegend(ts, getcolor, greyout, clusterrunid, cur):
     '''
     Add legend to the tree with cluster numbers corresponding to each color
     '''
-    #needs hex, not 0 to 1 RGB, this function wants a list so unpack and pack  back up
+    #needs hex, not the 0 to 255 RGB tuples from colormap, this function wants a list so unpack and pack  back up
     clusters, colors = list(zip(*list(getcolor.items())))
     colors = RGB_to_hex(colors)
     colorlist = list(zip(clusters, colors))
@@ -244,7 +243,7 @@ if __name__ == "__main__":
 
     # Now that we don't need to reference anything with the gene IDs any more, try to change them into
     # annotations
-    sanitizedToNot = getSanitizedContigList(cur)
+    sanitizedToNot = getSanitizedContigListCached(cur)
     for node in t.traverse():
         if node.is_leaf():
             unsanitized = unsanitizeGeneId(node.name)
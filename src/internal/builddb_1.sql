@@ -191,6 +191,8 @@ CREATE TABLE processed AS
 
 CREATE UNIQUE INDEX processedgeneids ON processed(geneid);
 CREATE INDEX processedcontigs ON processed(contig_mod);
+CREATE INDEX processedcontigstarts ON processed(contig_mod, genestart);
+CREATE INDEX processedcontigends ON processed(contig_mod, geneend);
 CREATE INDEX processedorganismids ON processed(organismid);
 CREATE INDEX processedorganisms ON processed(organism);
 